@@ -5,17 +5,27 @@ app.py
 Streamlit app to link 125 kHz UID into a member CSV on disk.
 Reads 'members.csv' (semicolon-separated) with columns:
 Vorname, Nachname, E-Mail, Transponder, etc.
+The columns the app needs are cached in 'members.parquet', which is
+rebuilt automatically whenever the CSV is newer.
 
-1. Combines Vorname + Nachname into a Name searchable dropdown.
+1. Combines Vorname + Nachname into a searchable Name list.
 2. Verify member’s E-Mail.
 3. Scan card over serial (FS-2044) to read UID.
 4. Overwrite 'members.csv' with updated Transponder column.
 """
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import atexit
+import csv
 import os
-import serial
-import serial.tools.list_ports
+import requests
+import shutil
+import tempfile
+import threading
 
 # 1) Page config must come first
 st.set_page_config(page_title="Mitglieder-Kartenlinker", layout="centered")
@@ -36,7 +46,11 @@ st.markdown("""
 
 # 3) Configuration
 CSV_FILENAME = 'members.csv'
+PARQUET_FILENAME = 'members.parquet'
+MEMBER_COLUMNS = ['Vorname', 'Nachname', 'E-Mail', 'Transponder']
 BAUD_RATE     = 9600
+MAX_MATCHES   = 50
+MIN_QUERY_LEN = 2
 LOGO_URL      = (
     "https://image.jimcdn.com/app/cms/image/transf/dimension%3D152x10000"
     ":format%3Dpng/path/s65ba28b2b3a08779/image/"
@@ -44,7 +58,12 @@ LOGO_URL      = (
 )
 
 # 4) Auto-detect serial port for FS-2044 reader (Windows or Linux)
+# pyserial is imported lazily: it is only needed for detection and scanning.
+# Port enumeration is slow (esp. on Windows), so it runs once per server
+# process; the port then stays fixed, keeping the serial handle below valid.
+@st.cache_data(show_spinner=False)
 def find_reader_port():
+    import serial.tools.list_ports
     ports = list(serial.tools.list_ports.comports())
     for p in ports:
         desc = (p.description or '').lower()
@@ -65,7 +84,19 @@ if 'uid' not in st.session_state:
     st.session_state.uid = ''
 
 # 6) Header with logo and title
-st.image(LOGO_URL, width=200)
+# Downloaded once per server process instead of on every rerun. A failed
+# download is cached too (as the URL, for the browser to load), so the server
+# tries the network at most once.
+@st.cache_resource(show_spinner=False)
+def load_logo(url):
+    try:
+        response = requests.get(url, timeout=5)
+        response.raise_for_status()
+    except requests.RequestException:
+        return url
+    return response.content
+
+st.image(load_logo(LOGO_URL), width=200)
 st.title("Mitglieder-Kartenlinker")
 
 # 7) Load CSV from disk
@@ -73,17 +104,110 @@ if not os.path.exists(CSV_FILENAME):
     st.error(f"Datei '{CSV_FILENAME}' nicht gefunden. Bitte im Arbeitsverzeichnis ablegen.")
     st.stop()
 
-df = pd.read_csv(CSV_FILENAME, sep=';', dtype=str).fillna('')
-if 'Transponder' not in df.columns:
-    df['Transponder'] = ''
-df['Name'] = df['Vorname'].str.strip() + ' ' + df['Nachname'].str.strip()
+# Convert the CSV once into a compressed Parquet file with only the columns
+# the app uses; reads then skip text parsing and the unused columns
+def refresh_parquet(csv_path, parquet_path):
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) > os.path.getmtime(csv_path):
+        return
+    # Every column is typed as string up front, so values are kept verbatim
+    # (no type guessing: '01067' stays '01067', empty cells stay '')
+    with open(csv_path, newline='', encoding='utf-8-sig') as f:
+        header = next(csv.reader(f, delimiter=';'), [])
+    try:
+        table = pa_csv.read_csv(
+            csv_path,
+            parse_options=pa_csv.ParseOptions(delimiter=';'),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={c: pa.string() for c in header},
+                include_columns=[c for c in MEMBER_COLUMNS if c in header],
+                strings_can_be_null=False,
+            ),
+        )
+    except pa.ArrowInvalid:
+        # pyarrow rejects rows with trimmed trailing fields; pandas pads them
+        df = pd.read_csv(
+            csv_path, sep=';', dtype=str, keep_default_na=False,
+            usecols=lambda c: c in MEMBER_COLUMNS,
+        )
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    for col in MEMBER_COLUMNS:
+        if col not in table.column_names:
+            table = table.append_column(col, pa.array([''] * table.num_rows, pa.string()))
+    # both parsers must yield the same schema (pandas gives large_string)
+    schema = pa.schema([(c, pa.string()) for c in MEMBER_COLUMNS])
+    # unique temp file: sessions run concurrently and may rebuild at once
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(parquet_path) or '.', prefix=os.path.basename(parquet_path) + '.', suffix='.tmp'
+    )
+    os.close(fd)
+    try:
+        pq.write_table(table.select(MEMBER_COLUMNS).cast(schema), tmp_path, compression='zstd')
+        os.replace(tmp_path, parquet_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# Cached per file mtime, so reruns (every widget change) skip re-reading
+@st.cache_data(show_spinner=False)
+def load_members(path, mtime):
+    table = pq.read_table(path, columns=MEMBER_COLUMNS)
+    # separator typed like the columns (pandas may write large_string)
+    sep = pa.scalar(' ', type=table.schema.field('Vorname').type)
+    names = pc.binary_join_element_wise(
+        pc.utf8_trim_whitespace(table['Vorname']), pc.utf8_trim_whitespace(table['Nachname']), sep
+    )
+    # Vorname/Nachname are only needed to build Name, so they aren't kept
+    df = pa.table({
+        'Name': names, 'E-Mail': table['E-Mail'], 'Transponder': table['Transponder'],
+    }).to_pandas(types_mapper=pd.ArrowDtype)
+    # contiguous lowercase names for the substring search
+    names_lower = pc.utf8_lower(names).combine_chunks()
+    # Name -> row position of its first occurrence, for O(1) lookups
+    name_to_idx = {}
+    for i, n in enumerate(df['Name'].tolist()):
+        name_to_idx.setdefault(n, i)
+    return df, name_to_idx, names_lower
 
-# 8) Name searchable dropdown (multiselect for filter)
-all_names = df['Name'].tolist()
-name_selection = st.multiselect(
-    "1. Name suchen und wählen", all_names, max_selections=1, key='name_multiselect'
-)
-name = name_selection[0] if name_selection else None
+# Keep the loaded frame in the session: st.cache_data hands out a fresh
+# unpickled copy on every hit, this only reloads when the file changes
+try:
+    refresh_parquet(CSV_FILENAME, PARQUET_FILENAME)
+except OSError as e:
+    st.error(f"Fehler beim Erstellen von '{PARQUET_FILENAME}': {e}")
+    st.stop()
+mtime = os.path.getmtime(PARQUET_FILENAME)
+if st.session_state.get('members_mtime') != mtime:
+    st.session_state.members = load_members(PARQUET_FILENAME, mtime)
+    st.session_state.members_mtime = mtime
+df, name_to_idx, names_lower = st.session_state.members
+
+# 8) Name search, filtered vectorised on the server so only matches are rendered.
+# The form only reruns the script on submit, and the matches are kept per
+# query so later reruns (email, scan, save) don't filter again.
+with st.form('search_form', clear_on_submit=False):
+    name_search = st.text_input("1. Name suchen", key='name_search').strip()
+    st.form_submit_button("Suchen")
+name = None
+if 0 < len(name_search) < MIN_QUERY_LEN:
+    st.info(f"Bitte mindestens {MIN_QUERY_LEN} Zeichen eingeben.")
+    st.stop()
+if name_search:
+    needle = name_search.lower()
+    if st.session_state.get('matches_key') != (needle, mtime):
+        mask = pc.match_substring(names_lower, needle).to_numpy(zero_copy_only=False)
+        # only the matched rows are turned into Python strings
+        hits = mask.nonzero()[0]
+        st.session_state.matches = df['Name'].iloc[hits[:MAX_MATCHES]].tolist()
+        st.session_state.match_count = len(hits)
+        st.session_state.matches_key = (needle, mtime)
+    filtered = st.session_state.matches
+    if st.session_state.match_count > MAX_MATCHES:
+        st.warning(f"Mehr als {MAX_MATCHES} Treffer – Suche verfeinern.")
+    if filtered:
+        name = st.radio("Mitglied wählen", filtered, index=None, key='name_radio')
+    else:
+        st.warning("Kein Mitglied gefunden.")
 if not name:
     st.info("Bitte einen Namen eingeben und auswählen.")
     st.stop()
@@ -91,20 +215,45 @@ if not name:
 # 9) Email verification
 email = st.text_input("2. E-Mail zur Verifikation", key='email').strip().lower()
 if st.button("Email prüfen"):
-    member = df[df['Name'] == name]
-    if not member.empty and member.iloc[0].get('E-Mail','').strip().lower() == email:
+    idx = name_to_idx.get(name)
+    if idx is not None and df.at[idx, 'E-Mail'].strip().lower() == email:
         st.success("Email verifiziert. Bitte Karte scannen.")
     else:
         st.error("Email stimmt nicht mit dem gewählten Mitglied überein.")
 
 # 10) Scan card button
+# The port is opened once per server process and shared, since opening a COM
+# port can take hundreds of ms on Windows. One handle per port: a session that
+# goes away can't keep an exclusive COM port locked against the next one.
+@st.cache_resource(show_spinner=False)
+def open_serial(port):
+    import serial
+    ser = serial.Serial(port, BAUD_RATE, timeout=2)
+    atexit.register(ser.close)
+    return ser
+
+# Sessions run in their own threads and pyserial isn't thread-safe, so a
+# scan holds the port's lock from flushing the buffer until the UID is read
+@st.cache_resource(show_spinner=False)
+def serial_lock(port):
+    return threading.Lock()
+
 def scan_card():
-    try:
-        with serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=2) as ser:
+    with serial_lock(SERIAL_PORT):
+        ser = None
+        try:
+            ser = open_serial(SERIAL_PORT)
+            # drop anything the reader sent before the button was pressed
+            ser.reset_input_buffer()
             return ser.readline().decode('ascii', errors='ignore').strip()
-    except Exception as e:
-        st.error(f"Fehler beim Lesen der Karte auf {SERIAL_PORT}: {e}")
-        return ''
+        except Exception as e:
+            # close the handle and drop it, the next click reopens the port
+            if ser is not None:
+                atexit.unregister(ser.close)
+                ser.close()
+            open_serial.clear(SERIAL_PORT)
+            st.error(f"Fehler beim Lesen der Karte auf {SERIAL_PORT}: {e}")
+            return ''
 
 if st.button(f"3. Karte scannen via {SERIAL_PORT}"):
     raw = scan_card()
@@ -120,10 +269,56 @@ uid = st.text_input(
 ).strip()
 
 # 12) Save and update CSV
+# Streams the file row by row and only rewrites the matching Transponder cell.
+# The copy is synced to disk before replacing the original, so a crash never
+# leaves a half-written members.csv behind. Returns the number of rows updated.
+def save_transponder(path, name, uid):
+    # unique temp file in the same directory: concurrent saves must not share it
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.', suffix='.tmp'
+    )
+    updated = 0
+    try:
+        # utf-8-sig: a leading BOM must not end up in the 'Vorname' header
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as dst, \
+             open(path, newline='', encoding='utf-8-sig') as src:
+            reader = csv.DictReader(src, delimiter=';')
+            # Only the file's own columns are written back; the derived Name
+            # column exists in the loaded DataFrame only
+            fieldnames = list(reader.fieldnames or [])
+            if 'Transponder' not in fieldnames:
+                fieldnames.append('Transponder')
+            writer = csv.DictWriter(dst, fieldnames=fieldnames, delimiter=';', lineterminator=os.linesep)
+            writer.writeheader()
+            for row in reader:
+                row_name = (row.get('Vorname') or '').strip() + ' ' + (row.get('Nachname') or '').strip()
+                if row_name == name:
+                    row['Transponder'] = uid
+                    updated += 1
+                writer.writerow(row)
+            dst.flush()
+            os.fsync(dst.fileno())
+        # mkstemp creates the file as 0600; keep the CSV's permissions
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    load_members.clear()
+    return updated
+
 if st.button("5. UID speichern und Datei aktualisieren"):
     if uid:
-        df.loc[df['Name'] == name, 'Transponder'] = uid
-        df.to_csv(CSV_FILENAME, sep=';', index=False)
-        st.success(f"UID {uid} gespeichert für {name}. Datei aktualisiert.")
+        try:
+            updated = save_transponder(CSV_FILENAME, name, uid)
+        except OSError as e:
+            # e.g. the file is still open in Excel on Windows
+            st.error(f"Fehler beim Speichern von '{CSV_FILENAME}': {e}")
+        else:
+            if updated:
+                st.success(f"UID {uid} gespeichert für {name}. Datei aktualisiert.")
+            else:
+                st.error(f"Kein Eintrag für {name} in '{CSV_FILENAME}' gefunden. Nichts gespeichert.")
     else:
         st.error("Keine UID vorhanden. Bitte Karte scannen oder manuell eingeben.")